@@ -11,18 +11,34 @@ Features:
 """
 import os
 import uuid
+import asyncio
 import httpx
 import base64
+import gzip
 import hashlib
+import io
 import json
+import mimetypes
+import re
+import tempfile
+import time
+import aiofiles
+import aiofiles.os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache, partial
+from itertools import combinations
 from datetime import datetime, timedelta
 from typing import Optional, List
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form, Depends, Cookie, Response
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Depends, Cookie, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.datastructures import Headers
 from pydantic import BaseModel
 
 # Google Auth for Vertex AI OAuth2 - wrap in try/except for graceful degradation
@@ -34,7 +50,35 @@ except ImportError:
     GOOGLE_AUTH_AVAILABLE = False
     print("Warning: google-auth library not available. Vertex AI features will be disabled.")
 
-app = FastAPI(title="Patagon3d", description="Real Photo AI Renovation & Measurement System")
+# Pillow for perceptual hashing - optional, similar-photo reuse is disabled without it
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    print("Warning: Pillow not available. Similar-photo measurement reuse will be disabled.")
+
+# Brotli for precompressed static assets - optional, gzip is always available
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+    print("Warning: brotli library not available. Static assets will be precompressed with gzip only.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background maintenance tasks for the lifetime of the app"""
+    cleanup_task = asyncio.create_task(cleanup_abandoned_uploads())
+    lag_monitor_task = asyncio.create_task(monitor_event_loop_lag())
+    yield
+    cleanup_task.cancel()
+    lag_monitor_task.cancel()
+    cpu_executor.shutdown(wait=False)
+
+
+app = FastAPI(title="Patagon3d", description="Real Photo AI Renovation & Measurement System", lifespan=lifespan)
 
 # CORS for mobile browser access
 app.add_middleware(
@@ -45,6 +89,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress API responses (already-encoded static assets and images are passed through).
+# Starlette >= 1.4 compresses large bodies off the event loop; level 5 keeps the CPU cost down.
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=5)
+
 # Google Vertex AI Configuration (Imagen 3.0 for image-to-image)
 GOOGLE_CLOUD_PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT_ID", "")
 GOOGLE_CLOUD_LOCATION = "us-central1"
@@ -88,11 +136,96 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 # Supabase Configuration (Image Storage)
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
+SUPABASE_PUBLIC_PREFIX = f"{SUPABASE_URL}/storage/v1/object/public/visualizer-images/"
+
+# Encoded image cache (repeated measurements and renovations of the same photo)
+IMAGE_PAYLOAD_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_PAYLOAD_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Upload limits and resumable upload storage
+MAX_UPLOAD_FILE_BYTES = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", 25 * 1024 * 1024))
+# Per-user quota covers new (non-duplicate) uploads within a rolling window
+MAX_UPLOAD_USER_BYTES = int(os.environ.get("MAX_UPLOAD_USER_BYTES", 200 * 1024 * 1024))
+UPLOAD_QUOTA_WINDOW_SECONDS = int(os.environ.get("UPLOAD_QUOTA_WINDOW_SECONDS", 60 * 60))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+UPLOAD_ABANDON_SECONDS = int(os.environ.get("UPLOAD_ABANDON_SECONDS", 60 * 60))
+UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "patagon3d-uploads"))
+
+# Executor for CPU-bound encode/decode/parse/image work, kept off the event loop
+CPU_EXECUTOR_WORKERS = int(os.environ.get("CPU_EXECUTOR_WORKERS", min(4, os.cpu_count() or 1)))
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL", 0.5))
+EVENT_LOOP_LAG_THRESHOLD_MS = float(os.environ.get("EVENT_LOOP_LAG_THRESHOLD_MS", 100))
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="patagon3d-cpu")
+
+# binascii and the json scanner hold the GIL for a whole call, so executor work on
+# base64 is done in bounded slices. Image payloads are kept as tuples of base64 chunks.
+BASE64_SLICE_BYTES = 3 * 256 * 1024
+BASE64_SLICE_CHARS = 4 * 256 * 1024
+
+# Event loop lag statistics, reported on /api/health
+event_loop_lag = {
+    "last_ms": 0.0,
+    "max_ms": 0.0,
+    "stalls": 0,
+    "last_stall_at": None
+}
+
+# Similar-photo measurement reuse (perceptual hash Hamming distance, 0-64)
+PHASH_MATCH_MAX_DISTANCE = int(os.environ.get("PHASH_MATCH_MAX_DISTANCE", 6))
+PHASH_AUTO_APPLY = os.environ.get("PHASH_AUTO_APPLY", "false").lower() == "true"
+
+# Payload formats per target provider
+PROVIDER_OPENAI = "openai"
+PROVIDER_VERTEX = "vertex"
+
+# Imagen models and progressive (preview, then full resolution) renovation
+IMAGEN_MODEL = "imagen-3.0-capability-001"
+# Imagen bills per output image, so previews only make sense with a cheaper model configured
+RENOVATION_PREVIEW_MODEL = os.environ.get("RENOVATION_PREVIEW_MODEL", "")
+RENOVATION_PREVIEW_ENABLED = bool(RENOVATION_PREVIEW_MODEL) and RENOVATION_PREVIEW_MODEL != IMAGEN_MODEL
+RENOVATION_PREVIEW_MAX_EDGE = int(os.environ.get("RENOVATION_PREVIEW_MAX_EDGE", 512))
+RENOVATION_PROGRESSIVE_DEFAULT = os.environ.get("RENOVATION_PROGRESSIVE", "false").lower() == "true" and RENOVATION_PREVIEW_ENABLED
+
+# Model routing: tiers ordered best quality first, picked per request to meet a latency SLO
+MEASUREMENT_MODEL_TIERS = json.loads(os.environ.get("MEASUREMENT_MODEL_TIERS", "null")) or [
+    {"name": "quality", "model": "gpt-4o", "detail": "high", "expected_seconds": 25},
+    {"name": "fast", "model": "gpt-4o-mini", "detail": "low", "expected_seconds": 8}
+]
+RENOVATION_MODEL_TIERS = json.loads(os.environ.get("RENOVATION_MODEL_TIERS", "null")) or [
+    {"name": "quality", "model": IMAGEN_MODEL, "expected_seconds": 30},
+    {
+        "name": "fast",
+        "model": IMAGEN_MODEL,
+        "max_edge": 1024,
+        "output_options": {"mimeType": "image/jpeg", "compressionQuality": 75},
+        "expected_seconds": 18
+    }
+]
+MEASUREMENT_SLO_SECONDS = float(os.environ.get("MEASUREMENT_SLO_SECONDS", 30))
+RENOVATION_SLO_SECONDS = float(os.environ.get("RENOVATION_SLO_SECONDS", 45))
+MEASUREMENT_PROVIDER_CAPACITY = int(os.environ.get("MEASUREMENT_PROVIDER_CAPACITY", 4))
+RENOVATION_PROVIDER_CAPACITY = int(os.environ.get("RENOVATION_PROVIDER_CAPACITY", 4))
+MODEL_LATENCY_WINDOW = int(os.environ.get("MODEL_LATENCY_WINDOW", 20))
+# Older samples are dropped so a tier that was slow gets retried once the provider recovers
+MODEL_LATENCY_MAX_AGE_SECONDS = float(os.environ.get("MODEL_LATENCY_MAX_AGE_SECONDS", 300))
 
 # Job stores
 renovation_jobs = {}
 measurement_jobs = {}
 uploaded_images = {}
+# Generated images kept in memory when Supabase storage is unavailable: job_id -> image
+generated_images = {}
+
+# Resumable uploads in progress: upload_id -> session
+upload_sessions = {}
+# Deduplication of finished uploads: (user_email, sha256) -> image_id
+image_ids_by_hash = {}
+
+# Running job tasks, so they can be cancelled: job_id -> {"task", "user_email"}
+job_tasks = {}
+
+# Perceptual hash index of measured photos, one per user
+phash_indexes = {}
 
 # Session store (in production, use Redis or database)
 sessions = {}
@@ -116,9 +249,159 @@ users_db = {
 # Pending user registrations
 pending_users = {}
 
+
+# ============================================================================
+# STATIC ASSETS
+# ============================================================================
+
+STATIC_DIR = "frontend/static"
+STATIC_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_COMPRESSIBLE_TYPES = {"text/css", "text/javascript", "application/javascript", "image/svg+xml"}
+
+# Fingerprinted path -> asset body and precompressed variants
+static_assets = {}
+# Source path -> fingerprinted path
+static_manifest = {}
+
+
+# String literals are matched first so comment markers and spaces inside them are kept
+CSS_STRING_OR_COMMENT = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/""", re.S)
+
+
+def collapse_css_whitespace(source: str) -> str:
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    return source.replace(";}", "}")
+
+
+def minify_css(source: str) -> str:
+    """Strip comments and collapse whitespace in a stylesheet, outside string literals"""
+    parts = []
+    position = 0
+    for match in CSS_STRING_OR_COMMENT.finditer(source):
+        parts.append(collapse_css_whitespace(source[position:match.start()]))
+        if match.group(1):
+            parts.append(match.group(1))
+        position = match.end()
+    parts.append(collapse_css_whitespace(source[position:]))
+    return "".join(parts).strip()
+
+
+def rewrite_static_references(source: str) -> str:
+    """Point /static/ references at already fingerprinted assets"""
+    for source_path, fingerprinted_path in static_manifest.items():
+        source = source.replace(f"/static/{source_path}", f"/static/{fingerprinted_path}")
+    return source
+
+
+def build_static_assets(static_dir: str = STATIC_DIR):
+    """Minify stylesheets, fingerprint and precompress static assets at startup"""
+    source_paths = []
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            source_paths.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/"))
+
+    # Stylesheets and scripts last so their references to images can be rewritten.
+    # Scripts are not minified: gzip/brotli recover most of the size without parsing JS.
+    text_extensions = {".css", ".js"}
+    source_paths.sort(key=lambda path: (os.path.splitext(path)[1] in text_extensions, path))
+
+    for source_path in source_paths:
+        with open(os.path.join(static_dir, source_path), "rb") as f:
+            body = f.read()
+
+        base, ext = os.path.splitext(source_path)
+        if ext in text_extensions:
+            text = rewrite_static_references(body.decode("utf-8"))
+            if ext == ".css":
+                text = minify_css(text)
+            body = text.encode("utf-8")
+
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        fingerprinted_path = f"{base}.{digest}{ext}"
+        media_type = mimetypes.guess_type(source_path)[0] or "application/octet-stream"
+
+        variants = {"identity": body}
+        if media_type in STATIC_COMPRESSIBLE_TYPES:
+            variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if BROTLI_AVAILABLE:
+                variants["br"] = brotli.compress(body, quality=11)
+
+        static_assets[fingerprinted_path] = {
+            "media_type": media_type,
+            "etag": f'"{digest}"',
+            "variants": variants
+        }
+        static_manifest[source_path] = fingerprinted_path
+
+
+def static_url(path: str) -> str:
+    """URL of the fingerprinted version of a static asset, for templates"""
+    return f"/static/{static_manifest.get(path, path)}"
+
+
+def negotiate_encoding(accept_encoding: str, available) -> str:
+    """Pick the best precompressed variant the client accepts"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = part.strip().split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+
+    for coding in ("br", "gzip"):
+        if coding in available and (coding in accepted or "*" in accepted):
+            return coding
+    return "identity"
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Serve fingerprinted assets from memory with immutable caching, else fall back to disk"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        asset = static_assets.get(path.replace(os.sep, "/"))
+        if asset is None:
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        headers = {
+            "Cache-Control": STATIC_IMMUTABLE_CACHE_CONTROL,
+            "ETag": asset["etag"],
+            "Vary": "Accept-Encoding"
+        }
+
+        if request_headers.get("if-none-match") == asset["etag"]:
+            return Response(status_code=304, headers=headers)
+
+        encoding = negotiate_encoding(request_headers.get("accept-encoding", ""), asset["variants"])
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        return Response(
+            content=asset["variants"][encoding],
+            media_type=asset["media_type"],
+            headers=headers
+        )
+
+
+try:
+    build_static_assets()
+except Exception as e:
+    print(f"Static asset build error: {e}")
+    static_assets.clear()
+    static_manifest.clear()
+
 # Templates
 templates = Jinja2Templates(directory="frontend/templates")
-app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
+templates.env.globals["static_url"] = static_url
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
 
 
 # ============================================================================
@@ -138,9 +421,16 @@ class UserApprovalRequest(BaseModel):
     email: str
     approve: bool
 
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: int
+    content_type: str = "image/jpeg"
+
 class MeasurementRequest(BaseModel):
     image_url: str
     room_type: str = "kitchen"
+    reuse_similar: Optional[bool] = None
+    slo_seconds: Optional[float] = None
 
 class RenovationRequest(BaseModel):
     image_url: str
@@ -149,12 +439,16 @@ class RenovationRequest(BaseModel):
     color: Optional[str] = None
     material: Optional[str] = None
     description: Optional[str] = None
+    progressive: Optional[bool] = None
+    slo_seconds: Optional[float] = None
 
 class MeasurementResult(BaseModel):
     job_id: str
     status: str
     image_url: str
     measurements: Optional[dict] = None
+    similar_match: Optional[dict] = None
+    routing: Optional[dict] = None
     error: Optional[str] = None
     created_at: str
 
@@ -162,8 +456,10 @@ class RenovationResult(BaseModel):
     job_id: str
     status: str
     original_url: str
+    preview_url: Optional[str] = None
     generated_url: Optional[str] = None
     prompt_used: Optional[str] = None
+    routing: Optional[dict] = None
     error: Optional[str] = None
     created_at: str
 
@@ -408,15 +704,140 @@ async def change_role(email: str, role: str = Form(...), admin: dict = Depends(r
 @app.post("/api/upload-image")
 async def upload_image(file: UploadFile = File(...), user: dict = Depends(require_auth)):
     """Upload a room photo for analysis and renovation"""
-    image_id = str(uuid.uuid4())
-    content = await file.read()
     content_type = file.content_type or "image/jpeg"
 
+    # Read in chunks so oversized uploads are rejected before they are fully buffered
+    sha256 = hashlib.sha256()
+    chunks = []
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_UPLOAD_FILE_BYTES:
+            raise HTTPException(status_code=413, detail="File too large")
+        sha256.update(chunk)
+        chunks.append(chunk)
+
+    return await store_uploaded_image(b"".join(chunks), sha256.hexdigest(), content_type, file.filename, user)
+
+
+@app.post("/api/uploads")
+async def init_upload(request: UploadInitRequest, user: dict = Depends(require_auth)):
+    """Start a resumable chunked upload"""
+    if request.size <= 0:
+        raise HTTPException(status_code=400, detail="Invalid file size")
+    if request.size > MAX_UPLOAD_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    # Stored bytes are checked at finalize, once the hash is known and duplicates are free
+    if pending_upload_bytes(user["email"]) + request.size > MAX_UPLOAD_USER_BYTES:
+        raise HTTPException(status_code=413, detail="Upload quota exceeded")
+
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    upload_id = str(uuid.uuid4())
+    path = os.path.join(UPLOAD_TMP_DIR, f"{upload_id}.part")
+    async with aiofiles.open(path, "wb"):
+        pass
+
+    upload_sessions[upload_id] = {
+        "user_email": user["email"],
+        "filename": request.filename,
+        "content_type": request.content_type,
+        "size": request.size,
+        "offset": 0,
+        "sha256": hashlib.sha256(),
+        "path": path,
+        "lock": asyncio.Lock(),
+        "updated_at": time.monotonic()
+    }
+
+    return {"upload_id": upload_id, "offset": 0, "size": request.size, "chunk_size": UPLOAD_CHUNK_SIZE}
+
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload_status(upload_id: str, user: dict = Depends(require_auth)):
+    """Get the offset to resume a chunked upload from"""
+    session = get_upload_session(upload_id, user)
+    return {"upload_id": upload_id, "offset": session["offset"], "size": session["size"]}
+
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request, user: dict = Depends(require_auth)):
+    """Append a chunk at the given offset, streaming it to disk"""
+    session = get_upload_session(upload_id, user)
+
+    async with session["lock"]:
+        # Finalize or cleanup may have removed the session while we waited
+        if upload_sessions.get(upload_id) is not session:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if offset != session["offset"]:
+            raise HTTPException(status_code=409, detail=f"Expected offset {session['offset']}")
+
+        try:
+            async with aiofiles.open(session["path"], "ab") as f:
+                async for data in request.stream():
+                    if session["offset"] + len(data) > session["size"]:
+                        raise HTTPException(status_code=413, detail="Chunk exceeds declared file size")
+                    await f.write(data)
+                    # Hash exactly what was written so a dropped chunk can resume from offset
+                    session["sha256"].update(data)
+                    session["offset"] += len(data)
+        finally:
+            session["updated_at"] = time.monotonic()
+
+    return {"upload_id": upload_id, "offset": session["offset"], "size": session["size"]}
+
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, user: dict = Depends(require_auth)):
+    """Finish a chunked upload and store it like a regular image upload"""
+    session = get_upload_session(upload_id, user)
+
+    async with session["lock"]:
+        if upload_sessions.get(upload_id) is not session:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if session["offset"] != session["size"]:
+            raise HTTPException(status_code=409, detail=f"Upload incomplete: {session['offset']} of {session['size']} bytes")
+
+        async with aiofiles.open(session["path"], "rb") as f:
+            content = await f.read()
+
+        del upload_sessions[upload_id]
+        await remove_upload_file(session["path"])
+
+    return await store_uploaded_image(
+        content,
+        session["sha256"].hexdigest(),
+        session["content_type"],
+        session["filename"],
+        user
+    )
+
+
+async def store_uploaded_image(content: bytes, content_hash: str, content_type: str, filename: Optional[str], user: dict) -> dict:
+    """Keep an uploaded image in memory and copy it to Supabase, deduplicating by content"""
+    existing_id = image_ids_by_hash.get((user["email"], content_hash))
+    if existing_id in uploaded_images:
+        existing = uploaded_images[existing_id]
+        return {
+            "success": True,
+            "image_id": existing_id,
+            "url": existing["url"],
+            "filename": filename,
+            "deduplicated": True
+        }
+
+    if user_upload_bytes(user["email"]) + len(content) > MAX_UPLOAD_USER_BYTES:
+        raise HTTPException(status_code=413, detail="Upload quota exceeded")
+
+    image_id = str(uuid.uuid4())
+
     uploaded_images[image_id] = {
         "content": content,
+        "sha256": content_hash,
+        "phash": await run_in_executor(compute_dhash, content),
         "content_type": content_type,
-        "filename": file.filename,
+        "filename": filename,
         "user_email": user["email"],
+        "stored_at": time.monotonic(),
         "created_at": datetime.utcnow().isoformat()
     }
 
@@ -435,18 +856,69 @@ async def upload_image(file: UploadFile = File(...), user: dict = Depends(requir
                     content=content
                 )
                 if response.status_code in [200, 201]:
-                    image_url = f"{SUPABASE_URL}/storage/v1/object/public/visualizer-images/{file_path}"
+                    image_url = f"{SUPABASE_PUBLIC_PREFIX}{file_path}"
         except Exception as e:
             print(f"Supabase upload error: {e}")
 
+    uploaded_images[image_id]["url"] = image_url
+    image_ids_by_hash[(user["email"], content_hash)] = image_id
+
     return {
         "success": True,
         "image_id": image_id,
         "url": image_url,
-        "filename": file.filename
+        "filename": filename
     }
 
 
+def get_upload_session(upload_id: str, user: dict) -> dict:
+    """Look up a resumable upload owned by the current user"""
+    session = upload_sessions.get(upload_id)
+    if not session or session["user_email"] != user["email"]:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+def pending_upload_bytes(user_email: str) -> int:
+    """Declared size of a user's in-progress resumable uploads"""
+    return sum(session["size"] for session in upload_sessions.values() if session["user_email"] == user_email)
+
+
+def user_upload_bytes(user_email: str) -> int:
+    """Bytes a user stored within the quota window plus declared in-progress uploads"""
+    cutoff = time.monotonic() - UPLOAD_QUOTA_WINDOW_SECONDS
+    stored = sum(
+        len(image["content"])
+        for image in uploaded_images.values()
+        if image["user_email"] == user_email and image["stored_at"] >= cutoff
+    )
+    return stored + pending_upload_bytes(user_email)
+
+
+async def remove_upload_file(path: str):
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def cleanup_abandoned_uploads():
+    """Periodically drop resumable uploads that stopped receiving chunks"""
+    # Partial files from a previous process have no session left to resume them
+    if os.path.isdir(UPLOAD_TMP_DIR):
+        for name in os.listdir(UPLOAD_TMP_DIR):
+            if name.endswith(".part"):
+                await remove_upload_file(os.path.join(UPLOAD_TMP_DIR, name))
+
+    while True:
+        await asyncio.sleep(min(UPLOAD_ABANDON_SECONDS, 300))
+        cutoff = time.monotonic() - UPLOAD_ABANDON_SECONDS
+        for upload_id, session in list(upload_sessions.items()):
+            if session["updated_at"] < cutoff and not session["lock"].locked():
+                del upload_sessions[upload_id]
+                await remove_upload_file(session["path"])
+
+
 @app.get("/api/image/{image_id}")
 async def get_image(image_id: str):
     """Serve uploaded image from memory"""
@@ -454,10 +926,11 @@ async def get_image(image_id: str):
         raise HTTPException(status_code=404, detail="Image not found")
 
     image_data = uploaded_images[image_id]
+    image_base64 = await run_in_executor(b64encode_str, image_data["content"])
     return JSONResponse(
         content={"error": "Use direct URL"},
         status_code=302,
-        headers={"Location": f"data:{image_data['content_type']};base64,{base64.b64encode(image_data['content']).decode()}"}
+        headers={"Location": f"data:{image_data['content_type']};base64,{image_base64}"}
     )
 
 
@@ -466,10 +939,12 @@ async def get_image(image_id: str):
 # ============================================================================
 
 @app.post("/api/analyze-measurements")
-async def analyze_measurements(background_tasks: BackgroundTasks, request: MeasurementRequest, user: dict = Depends(require_auth)):
+async def analyze_measurements(request: MeasurementRequest, user: dict = Depends(require_auth)):
     """Analyze a room photo using GPT-4 Vision to estimate measurements"""
     if not OPENAI_API_KEY:
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
+    if request.slo_seconds is not None and request.slo_seconds <= 0:
+        raise HTTPException(status_code=400, detail="slo_seconds must be positive")
 
     job_id = str(uuid.uuid4())
     now = datetime.utcnow().isoformat()
@@ -481,15 +956,49 @@ async def analyze_measurements(background_tasks: BackgroundTasks, request: Measu
         created_at=now
     )
 
-    background_tasks.add_task(process_measurement_analysis, job_id, request.image_url, request.room_type)
+    reuse_similar = PHASH_AUTO_APPLY if request.reuse_similar is None else request.reuse_similar
+
+    start_job(job_id, user["email"], process_measurement_analysis(
+        job_id,
+        request.image_url,
+        request.room_type,
+        user["email"],
+        reuse_similar,
+        MEASUREMENT_SLO_SECONDS if request.slo_seconds is None else request.slo_seconds
+    ))
 
     return {"job_id": job_id, "status": "processing", "message": "Analyzing image for measurements..."}
 
 
-async def process_measurement_analysis(job_id: str, image_url: str, room_type: str):
+async def process_measurement_analysis(
+    job_id: str,
+    image_url: str,
+    room_type: str,
+    user_email: str,
+    reuse_similar: bool = False,
+    slo_seconds: float = MEASUREMENT_SLO_SECONDS
+):
     """Use GPT-4 Vision to analyze room and estimate measurements"""
+    job_started = time.monotonic()
     try:
-        image_base64 = await get_image_base64(image_url)
+        phash = await get_image_phash(image_url)
+        if phash is not None:
+            match = find_similar_measurement(user_email, phash, room_type)
+            if match:
+                measurement_jobs[job_id].similar_match = {
+                    "job_id": match["job_id"],
+                    "distance": match["distance"],
+                    "applied": reuse_similar
+                }
+                if reuse_similar:
+                    measurement_jobs[job_id].measurements = match["measurements"]
+                    measurement_jobs[job_id].status = "completed"
+                    return
+
+        image_payload = await get_image_payload(image_url, PROVIDER_OPENAI)
+        # Image fetch and hashing already used part of the SLO
+        remaining_seconds = round(slo_seconds - (time.monotonic() - job_started), 2)
+        tier, estimated_seconds = measurement_router.choose(remaining_seconds)
 
         async with httpx.AsyncClient(timeout=120.0) as client:
             analysis_prompt = f"""Analyze this {room_type} photo and provide detailed measurements and estimates.
@@ -542,32 +1051,47 @@ Return as JSON with this structure:
   "notes": "string with any important observations"
 }}"""
 
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-4o",
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": analysis_prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{image_base64}",
-                                        "detail": "high"
-                                    }
+            body, body_length = await run_in_executor(json_body_with_image, {
+                "model": tier["model"],
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": analysis_prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": IMAGE_PLACEHOLDER,
+                                    "detail": tier.get("detail", "high")
                                 }
-                            ]
-                        }
-                    ],
-                    "max_tokens": 2000
-                }
-            )
+                            }
+                        ]
+                    }
+                ],
+                "max_tokens": 2000
+            }, image_payload)
+
+            with measurement_router.track(tier) as call:
+                response = await client.post(
+                    "https://api.openai.com/v1/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {OPENAI_API_KEY}",
+                        "Content-Type": "application/json",
+                        "Content-Length": str(body_length)
+                    },
+                    content=iter_chunks(body)
+                )
+                call["ok"] = response.status_code == 200
+
+            measurement_jobs[job_id].routing = {
+                "tier": tier["name"],
+                "model": tier["model"],
+                "detail": tier.get("detail", "high"),
+                "estimated_seconds": estimated_seconds,
+                "latency_seconds": call["seconds"],
+                "slo_seconds": slo_seconds,
+                "remaining_seconds": remaining_seconds
+            }
 
             if response.status_code == 200:
                 result = response.json()
@@ -587,6 +1111,13 @@ Return as JSON with this structure:
 
                 measurement_jobs[job_id].status = "completed"
                 measurement_jobs[job_id].measurements = measurements
+
+                if phash is not None and "raw_analysis" not in measurements:
+                    index_measurement(user_email, phash, {
+                        "job_id": job_id,
+                        "room_type": room_type,
+                        "measurements": measurements
+                    })
             else:
                 measurement_jobs[job_id].status = "failed"
                 measurement_jobs[job_id].error = f"OpenAI API error: {response.status_code}"
@@ -604,15 +1135,25 @@ async def get_measurement_status(job_id: str):
     return measurement_jobs[job_id]
 
 
+@app.delete("/api/measurements/{job_id}")
+async def cancel_measurement(job_id: str, user: dict = Depends(require_auth)):
+    """Cancel a running measurement analysis"""
+    if job_id not in measurement_jobs:
+        raise HTTPException(status_code=404, detail="Measurement job not found")
+    return cancel_job(job_id, measurement_jobs[job_id], user)
+
+
 # ============================================================================
 # AI RENOVATION (Google Vertex AI Imagen 3.0 - Image-to-Image)
 # ============================================================================
 
 @app.post("/api/renovate")
-async def generate_renovation(background_tasks: BackgroundTasks, request: RenovationRequest, user: dict = Depends(require_auth)):
+async def generate_renovation(request: RenovationRequest, user: dict = Depends(require_auth)):
     """Generate AI renovation by modifying the REAL uploaded photo"""
     if not GOOGLE_SERVICE_ACCOUNT_JSON:
         raise HTTPException(status_code=500, detail="Google Service Account not configured")
+    if request.slo_seconds is not None and request.slo_seconds <= 0:
+        raise HTTPException(status_code=400, detail="slo_seconds must be positive")
 
     job_id = str(uuid.uuid4())
     now = datetime.utcnow().isoformat()
@@ -624,20 +1165,120 @@ async def generate_renovation(background_tasks: BackgroundTasks, request: Renova
         created_at=now
     )
 
-    background_tasks.add_task(
-        process_renovation,
+    start_job(job_id, user["email"], process_renovation(
         job_id,
         request.image_url,
         request.element_type,
         request.style,
         request.color,
         request.material,
-        request.description
-    )
+        request.description,
+        RENOVATION_PROGRESSIVE_DEFAULT if request.progressive is None else request.progressive and RENOVATION_PREVIEW_ENABLED,
+        RENOVATION_SLO_SECONDS if request.slo_seconds is None else request.slo_seconds
+    ))
 
     return {"job_id": job_id, "status": "processing", "message": "Generating AI renovation..."}
 
 
+def build_renovation_prompt(
+    element_type: str,
+    style: str,
+    color: Optional[str],
+    material: Optional[str],
+    description: Optional[str]
+) -> str:
+    """Build the Imagen edit prompt for the selected element and style"""
+    preserve_clause = "DO NOT change any other elements in the room. Keep walls, windows, doors, ceiling, lighting, and all other fixtures exactly the same."
+
+    if element_type == "cabinets":
+        color_desc = color or "white"
+        style_desc = style or "modern shaker"
+        prompt = f"Edit this kitchen photo: replace ONLY the kitchen cabinets with {color_desc} {style_desc} style cabinets. {preserve_clause}"
+
+    elif element_type == "countertops":
+        material_desc = material or "quartz"
+        color_desc = color or "white with gray veining"
+        prompt = f"Edit this kitchen photo: replace ONLY the countertops with {color_desc} {material_desc} countertops. {preserve_clause}"
+
+    elif element_type == "backsplash":
+        material_desc = material or "subway tile"
+        color_desc = color or "white"
+        prompt = f"Edit this kitchen photo: replace ONLY the backsplash with {color_desc} {material_desc}. {preserve_clause}"
+
+    elif element_type == "flooring":
+        material_desc = material or "hardwood"
+        color_desc = color or "medium oak"
+        prompt = f"Edit this kitchen photo: replace ONLY the floor with {color_desc} {material_desc} flooring with visible wood grain. {preserve_clause}"
+
+    elif element_type == "appliances":
+        style_desc = style or "stainless steel"
+        prompt = f"Edit this kitchen photo: replace ONLY the visible appliances with modern {style_desc} appliances. {preserve_clause}"
+
+    else:
+        prompt = f"Edit this room photo: {description or 'modernize the space'}. {preserve_clause}"
+
+    style_additions = {
+        "modern": "Clean lines, minimalist hardware, contemporary fixtures.",
+        "farmhouse": "Rustic wood elements, vintage-inspired hardware, warm tones.",
+        "transitional": "Blend of traditional and modern, neutral palette, classic shapes.",
+        "contemporary": "Bold design, luxury materials, high-end finishes."
+    }
+    if style in style_additions:
+        prompt += f" Style: {style_additions[style]}"
+
+    return prompt
+
+
+async def request_imagen_edit(
+    client: httpx.AsyncClient,
+    image_payload: tuple,
+    prompt: str,
+    model: str = IMAGEN_MODEL,
+    output_options: Optional[dict] = None
+) -> tuple:
+    """Run one Imagen image-to-image prediction and return the generated image as base64 chunks"""
+    # Token refresh is blocking network I/O, so it stays off the CPU executor
+    access_token = await asyncio.to_thread(get_vertex_access_token)
+    imagen_url = f"https://{GOOGLE_CLOUD_LOCATION}-aiplatform.googleapis.com/v1/projects/{GOOGLE_CLOUD_PROJECT_ID}/locations/{GOOGLE_CLOUD_LOCATION}/publishers/google/models/{model}:predict"
+
+    parameters = {"sampleCount": 1}
+    if output_options:
+        parameters["outputOptions"] = output_options
+
+    body, body_length = await run_in_executor(json_body_with_image, {
+        "instances": [
+            {
+                "prompt": prompt,
+                "referenceImages": [
+                    {
+                        "referenceType": "REFERENCE_TYPE_RAW",
+                        "referenceId": 1,
+                        "referenceImage": {
+                            "bytesBase64Encoded": IMAGE_PLACEHOLDER
+                        }
+                    }
+                ]
+            }
+        ],
+        "parameters": parameters
+    }, image_payload)
+
+    response = await client.post(
+        imagen_url,
+        headers={
+            "Content-Type": "application/json",
+            "Content-Length": str(body_length),
+            "Authorization": f"Bearer {access_token}"
+        },
+        content=iter_chunks(body)
+    )
+
+    if response.status_code != 200:
+        raise Exception(f"Imagen API error: {response.status_code} - {response.text}")
+
+    return await run_in_executor(parse_imagen_prediction, response.content)
+
+
 async def process_renovation(
     job_id: str,
     image_url: str,
@@ -645,115 +1286,96 @@ async def process_renovation(
     style: str,
     color: Optional[str],
     material: Optional[str],
-    description: Optional[str]
+    description: Optional[str],
+    progressive: bool = False,
+    slo_seconds: float = RENOVATION_SLO_SECONDS
 ):
     """Use Google Vertex AI Imagen 3.0 to modify the real photo"""
+    job_started = time.monotonic()
     try:
-        image_base64 = await get_image_base64(image_url)
-
-        preserve_clause = "DO NOT change any other elements in the room. Keep walls, windows, doors, ceiling, lighting, and all other fixtures exactly the same."
-
-        if element_type == "cabinets":
-            color_desc = color or "white"
-            style_desc = style or "modern shaker"
-            prompt = f"Edit this kitchen photo: replace ONLY the kitchen cabinets with {color_desc} {style_desc} style cabinets. {preserve_clause}"
-
-        elif element_type == "countertops":
-            material_desc = material or "quartz"
-            color_desc = color or "white with gray veining"
-            prompt = f"Edit this kitchen photo: replace ONLY the countertops with {color_desc} {material_desc} countertops. {preserve_clause}"
-
-        elif element_type == "backsplash":
-            material_desc = material or "subway tile"
-            color_desc = color or "white"
-            prompt = f"Edit this kitchen photo: replace ONLY the backsplash with {color_desc} {material_desc}. {preserve_clause}"
-
-        elif element_type == "flooring":
-            material_desc = material or "hardwood"
-            color_desc = color or "medium oak"
-            prompt = f"Edit this kitchen photo: replace ONLY the floor with {color_desc} {material_desc} flooring with visible wood grain. {preserve_clause}"
-
-        elif element_type == "appliances":
-            style_desc = style or "stainless steel"
-            prompt = f"Edit this kitchen photo: replace ONLY the visible appliances with modern {style_desc} appliances. {preserve_clause}"
-
-        else:
-            prompt = f"Edit this room photo: {description or 'modernize the space'}. {preserve_clause}"
-
-        style_additions = {
-            "modern": "Clean lines, minimalist hardware, contemporary fixtures.",
-            "farmhouse": "Rustic wood elements, vintage-inspired hardware, warm tones.",
-            "transitional": "Blend of traditional and modern, neutral palette, classic shapes.",
-            "contemporary": "Bold design, luxury materials, high-end finishes."
-        }
-        if style in style_additions:
-            prompt += f" Style: {style_additions[style]}"
+        image_payload = await get_image_payload(image_url, PROVIDER_VERTEX)
 
+        prompt = build_renovation_prompt(element_type, style, color, material, description)
         renovation_jobs[job_id].prompt_used = prompt
 
         async with httpx.AsyncClient(timeout=120.0) as client:
-            # Get OAuth2 access token
-            access_token = get_vertex_access_token()
-            imagen_url = f"https://{GOOGLE_CLOUD_LOCATION}-aiplatform.googleapis.com/v1/projects/{GOOGLE_CLOUD_PROJECT_ID}/locations/{GOOGLE_CLOUD_LOCATION}/publishers/google/models/imagen-3.0-capability-001:predict"
-
-            response = await client.post(
-                imagen_url,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {access_token}"
-                },
-                json={
-                    "instances": [
-                        {
-                            "prompt": prompt,
-                            "referenceImages": [
-                                {
-                                    "referenceType": "REFERENCE_TYPE_RAW",
-                                    "referenceId": 1,
-                                    "referenceImage": {
-                                        "bytesBase64Encoded": image_base64
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    "parameters": {
-                        "sampleCount": 1
-                    }
-                }
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                generated_base64 = result["predictions"][0]["bytesBase64Encoded"]
-
-                generated_url = f"data:image/jpeg;base64,{generated_base64}"
-
-                if SUPABASE_URL and SUPABASE_SERVICE_KEY:
-                    try:
-                        generated_bytes = base64.b64decode(generated_base64)
-                        file_path = f"patagon3d/generated/{job_id}.jpg"
-
-                        upload_response = await client.post(
-                            f"{SUPABASE_URL}/storage/v1/object/visualizer-images/{file_path}",
-                            headers={
-                                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                                "Content-Type": "image/jpeg"
-                            },
-                            content=generated_bytes
+            if progressive:
+                # Quick low-resolution pass so the user can judge the direction early
+                try:
+                    preview_source = await get_downscaled_image_payload(image_payload, RENOVATION_PREVIEW_MAX_EDGE)
+                    # Not a routing tier, but it occupies provider capacity while it runs
+                    with renovation_router.track(None):
+                        preview_chunks = await request_imagen_edit(
+                            client,
+                            preview_source,
+                            prompt,
+                            model=RENOVATION_PREVIEW_MODEL,
+                            output_options={"mimeType": "image/jpeg", "compressionQuality": 60}
                         )
+                    preview_base64 = await run_in_executor(chunks_to_str, preview_chunks)
+                    renovation_jobs[job_id].preview_url = f"data:image/jpeg;base64,{preview_base64}"
+                except Exception as e:
+                    print(f"Renovation preview error: {e}")
+
+            # Image fetch and the preview already used part of the SLO
+            remaining_seconds = round(slo_seconds - (time.monotonic() - job_started), 2)
+            tier, estimated_seconds = renovation_router.choose(remaining_seconds)
+            source_payload = image_payload
+            if tier.get("max_edge"):
+                source_payload = await get_downscaled_image_payload(image_payload, tier["max_edge"])
+
+            with renovation_router.track(tier) as call:
+                generated_chunks = await request_imagen_edit(
+                    client,
+                    source_payload,
+                    prompt,
+                    model=tier["model"],
+                    output_options=tier.get("output_options")
+                )
+                call["ok"] = True
+
+            renovation_jobs[job_id].routing = {
+                "tier": tier["name"],
+                "model": tier["model"],
+                "max_edge": tier.get("max_edge"),
+                "estimated_seconds": estimated_seconds,
+                "latency_seconds": call["seconds"],
+                "slo_seconds": slo_seconds,
+                "remaining_seconds": remaining_seconds
+            }
+
+            generated_url = None
+            generated_bytes = await run_in_executor(b64decode_chunks, generated_chunks)
+
+            if SUPABASE_URL and SUPABASE_SERVICE_KEY:
+                try:
+                    file_path = f"patagon3d/generated/{job_id}.jpg"
+
+                    upload_response = await client.post(
+                        f"{SUPABASE_URL}/storage/v1/object/visualizer-images/{file_path}",
+                        headers={
+                            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+                            "Content-Type": "image/jpeg",
+                            "Content-Length": str(payload_size(generated_bytes))
+                        },
+                        content=iter_chunks(generated_bytes)
+                    )
+
+                    if upload_response.status_code in [200, 201]:
+                        generated_url = f"{SUPABASE_PUBLIC_PREFIX}{file_path}"
+                except Exception as e:
+                    print(f"Supabase upload error: {e}")
+
+            if generated_url is None:
+                # Served by URL rather than as a data URL so status polls stay small
+                generated_images[job_id] = {
+                    "content": await run_in_executor(b"".join, generated_bytes),
+                    "content_type": "image/jpeg"
+                }
+                generated_url = f"/api/renovation/{job_id}/image"
 
-                        if upload_response.status_code in [200, 201]:
-                            generated_url = f"{SUPABASE_URL}/storage/v1/object/public/visualizer-images/{file_path}"
-                    except Exception as e:
-                        print(f"Supabase upload error: {e}")
-
-                renovation_jobs[job_id].status = "completed"
-                renovation_jobs[job_id].generated_url = generated_url
-            else:
-                error_text = response.text
-                renovation_jobs[job_id].status = "failed"
-                renovation_jobs[job_id].error = f"Imagen API error: {response.status_code} - {error_text}"
+            renovation_jobs[job_id].status = "completed"
+            renovation_jobs[job_id].generated_url = generated_url
 
     except Exception as e:
         renovation_jobs[job_id].status = "failed"
@@ -768,26 +1390,527 @@ async def get_renovation_status(job_id: str):
     return renovation_jobs[job_id]
 
 
+@app.get("/api/renovation/{job_id}/image")
+async def get_generated_image(job_id: str):
+    """Serve a generated image kept in memory"""
+    if job_id not in generated_images:
+        raise HTTPException(status_code=404, detail="Generated image not found")
+
+    image = generated_images[job_id]
+    return Response(content=image["content"], media_type=image["content_type"])
+
+
+@app.delete("/api/renovation/{job_id}")
+async def cancel_renovation(job_id: str, user: dict = Depends(require_auth)):
+    """Cancel a running renovation"""
+    if job_id not in renovation_jobs:
+        raise HTTPException(status_code=404, detail="Renovation job not found")
+    return cancel_job(job_id, renovation_jobs[job_id], user)
+
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
-async def get_image_base64(image_url: str) -> str:
-    """Get image as base64 string from URL or memory"""
+async def run_in_executor(func, *args):
+    """Run CPU-bound work on the bounded executor
+
+    Only GIL-releasing calls (hashlib, Pillow) or work split into bounded slices
+    belong here; a single long GIL-holding call still stalls the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, partial(func, *args))
+
+
+def b64encode_chunks(content: bytes) -> tuple:
+    """Base64-encode in slices, releasing the GIL between them"""
+    view = memoryview(content)
+    return tuple(
+        base64.b64encode(view[i:i + BASE64_SLICE_BYTES])
+        for i in range(0, len(content), BASE64_SLICE_BYTES)
+    )
+
+
+def b64decode_chunks(chunks) -> list:
+    """Decode base64 chunks (each a multiple of 4 characters) slice by slice"""
+    return [base64.b64decode(chunk) for chunk in chunks]
+
+
+def str_to_chunks(text: str, start: int = 0) -> tuple:
+    """Split base64 text into ASCII chunks, starting at an offset such as after a data URL comma"""
+    return tuple(
+        text[i:i + BASE64_SLICE_CHARS].encode("ascii")
+        for i in range(start, len(text), BASE64_SLICE_CHARS)
+    )
+
+
+def chunks_to_str(chunks) -> str:
+    return "".join([chunk.decode("ascii") for chunk in chunks])
+
+
+def b64encode_str(content: bytes) -> str:
+    return chunks_to_str(b64encode_chunks(content))
+
+
+def payload_size(chunks) -> int:
+    return sum(len(chunk) for chunk in chunks)
+
+
+def sha256_hex(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def sha256_chunks(chunks) -> str:
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Stands in for the image while a request envelope is serialized
+IMAGE_PLACEHOLDER = "__patagon3d_image__"
+
+
+def json_body_with_image(envelope: dict, image_payload: tuple) -> tuple:
+    """Serialize a JSON request with the image chunks spliced in, never encoding the image as one string"""
+    prefix, suffix = json.dumps(envelope).encode().split(f'"{IMAGE_PLACEHOLDER}"'.encode())
+    parts = (prefix + b'"', *image_payload, b'"' + suffix)
+    return parts, payload_size(parts)
+
+
+async def iter_chunks(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+IMAGEN_IMAGE_FIELD = b'"bytesBase64Encoded"'
+
+
+def find_in_slices(buffer: bytes, needle: bytes, start: int) -> int:
+    """bytes.find over bounded slices, releasing the GIL between them"""
+    position = start
+    while position < len(buffer):
+        found = buffer.find(needle, position, position + BASE64_SLICE_CHARS + len(needle))
+        if found != -1:
+            return found
+        position += BASE64_SLICE_CHARS
+    return -1
+
+
+def parse_imagen_prediction(content: bytes) -> tuple:
+    """Extract the first predicted image of an Imagen response as base64 chunks
+
+    The image string is located and sliced directly instead of running json.loads
+    over the multi-megabyte response.
+    """
+    field = find_in_slices(content, IMAGEN_IMAGE_FIELD, 0)
+    if field != -1:
+        value_start = content.find(b'"', field + len(IMAGEN_IMAGE_FIELD)) + 1
+        value_end = find_in_slices(content, b'"', value_start)
+        separator = content[field + len(IMAGEN_IMAGE_FIELD):value_start - 1].strip()
+        if value_start > 0 and value_end != -1 and separator == b":":
+            view = memoryview(content)[value_start:value_end]
+            chunks = tuple(bytes(view[i:i + BASE64_SLICE_CHARS]) for i in range(0, len(view), BASE64_SLICE_CHARS))
+            # Base64 never needs JSON escapes; anything unexpected takes the full parse
+            if not any(b"\\" in chunk for chunk in chunks):
+                return chunks
+
+    result = json.loads(content)
+    return str_to_chunks(result["predictions"][0]["bytesBase64Encoded"])
+
+
+async def monitor_event_loop_lag():
+    """Measure how late the event loop wakes up and report stalls above the threshold"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        lag_ms = max(0.0, (loop.time() - started - EVENT_LOOP_LAG_INTERVAL) * 1000)
+
+        event_loop_lag["last_ms"] = round(lag_ms, 1)
+        event_loop_lag["max_ms"] = max(event_loop_lag["max_ms"], round(lag_ms, 1))
+        if lag_ms > EVENT_LOOP_LAG_THRESHOLD_MS:
+            event_loop_lag["stalls"] += 1
+            event_loop_lag["last_stall_at"] = datetime.utcnow().isoformat()
+            print(f"Event loop stall: {lag_ms:.0f} ms")
+
+
+class ModelRouter:
+    """Pick a model tier per request from rolling latency and provider queue depth"""
+
+    def __init__(self, tiers: List[dict], capacity: int, window: int = MODEL_LATENCY_WINDOW):
+        self.tiers = tiers
+        self.capacity = max(1, capacity)
+        self.in_flight = 0
+        self.latencies = {tier["name"]: deque(maxlen=window) for tier in tiers}
+
+    def rolling_latency(self, tier: dict) -> float:
+        """Median of recent call latencies, or the configured expectation without any"""
+        cutoff = time.monotonic() - MODEL_LATENCY_MAX_AGE_SECONDS
+        samples = sorted(seconds for recorded_at, seconds in self.latencies[tier["name"]] if recorded_at >= cutoff)
+        if not samples:
+            return float(tier.get("expected_seconds", 0))
+        return samples[len(samples) // 2]
+
+    def estimate(self, tier: dict) -> float:
+        """Expected seconds for a new call, stretched by calls queued beyond provider capacity"""
+        queued = max(0, self.in_flight + 1 - self.capacity)
+        return self.rolling_latency(tier) * (1 + queued / self.capacity)
+
+    def choose(self, slo_seconds: float) -> tuple:
+        """Best quality tier expected to meet the SLO, else the fastest one"""
+        estimates = [(tier, round(self.estimate(tier), 2)) for tier in self.tiers]
+        for tier, estimated_seconds in estimates:
+            if estimated_seconds <= slo_seconds:
+                return tier, estimated_seconds
+        return min(estimates, key=lambda estimate: estimate[1])
+
+    @contextmanager
+    def track(self, tier: Optional[dict]):
+        """Count a provider call as in flight and record its latency sample
+
+        Calls the caller marks ok, timeouts and failures slower than the tier's current
+        estimate are recorded, so a hanging provider pushes routing to a faster tier.
+        Cancellations and fast failures (429/5xx) are skipped so they can't drag the
+        median down. Calls outside the tiers pass tier=None.
+        """
+        call = {"seconds": None, "ok": False}
+        self.in_flight += 1
+        started = time.monotonic()
+        cancelled = False
+        timed_out = False
+        try:
+            yield call
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except httpx.TimeoutException:
+            timed_out = True
+            raise
+        finally:
+            self.in_flight -= 1
+            call["seconds"] = round(time.monotonic() - started, 2)
+            if tier is not None and not cancelled:
+                slow = call["seconds"] > self.rolling_latency(tier)
+                if call["ok"] or timed_out or slow:
+                    self.latencies[tier["name"]].append((time.monotonic(), call["seconds"]))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "capacity": self.capacity,
+            "tiers": {
+                tier["name"]: {
+                    "model": tier["model"],
+                    "rolling_latency_seconds": self.rolling_latency(tier),
+                    "samples": len(self.latencies[tier["name"]])
+                }
+                for tier in self.tiers
+            }
+        }
+
+
+measurement_router = ModelRouter(MEASUREMENT_MODEL_TIERS, MEASUREMENT_PROVIDER_CAPACITY)
+renovation_router = ModelRouter(RENOVATION_MODEL_TIERS, RENOVATION_PROVIDER_CAPACITY)
+
+
+def start_job(job_id: str, user_email: str, coro):
+    """Run a job coroutine as a task that can be cancelled later"""
+    task = asyncio.create_task(coro)
+    job_tasks[job_id] = {"task": task, "user_email": user_email}
+    task.add_done_callback(lambda _: job_tasks.pop(job_id, None))
+    return task
+
+
+def cancel_job(job_id: str, job, user: dict) -> dict:
+    """Cancel a job's task, aborting any in-flight provider request"""
+    job_task = job_tasks.get(job_id)
+
+    if job_task:
+        if job_task["user_email"] != user["email"] and user.get("role") != "admin":
+            raise HTTPException(status_code=403, detail="Not your job")
+        # Cancellation is raised inside the pending httpx call, closing its connection
+        if job_task["task"].cancel():
+            job.status = "cancelled"
+
+    return {"success": True, "job_id": job_id, "status": job.status}
+
+
+class ImagePayloadCache:
+    """LRU cache of base64 image chunks keyed by content hash and variant (original or downscaled)
+
+    Provider-specific wrapping is applied on read, so one entry serves every provider.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._url_hashes = {}
+
+    def get(self, content_hash: str, variant: str) -> Optional[tuple]:
+        key = (content_hash, variant)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, content_hash: str, variant: str, payload: tuple):
+        key = (content_hash, variant)
+        if key in self._entries:
+            self.total_bytes -= self._entries.pop(key)[1]
+
+        # Payloads larger than the whole budget are never cached
+        size = payload_size(payload)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (payload, size)
+        self.total_bytes += size
+
+        evicted = False
+        while self.total_bytes > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.total_bytes -= old_size
+            evicted = True
+
+        if evicted:
+            cached_hashes = {h for h, _ in self._entries}
+            self._url_hashes = {u: h for u, h in self._url_hashes.items() if h in cached_hashes}
+
+    def hash_for_url(self, image_url: str) -> Optional[str]:
+        return self._url_hashes.get(image_url)
+
+    def remember_url(self, image_url: str, content_hash: str):
+        self._url_hashes[image_url] = content_hash
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+
+image_payload_cache = ImagePayloadCache(IMAGE_PAYLOAD_CACHE_MAX_BYTES)
+IMAGE_VARIANT_ORIGINAL = "original"
+
+
+def format_image_payload(image_chunks: tuple, provider: str) -> tuple:
+    """Wrap base64 image chunks the way the target provider expects them"""
+    if provider == PROVIDER_OPENAI:
+        return (b"data:image/jpeg;base64,", *image_chunks)
+    return image_chunks
+
+
+async def get_downscaled_image_payload(image_payload: tuple, max_edge: int) -> tuple:
+    """Downscale a base64 image payload for a faster render, cached per source image and size"""
+    if not PIL_AVAILABLE:
+        return image_payload
+
+    source_hash = await run_in_executor(sha256_chunks, image_payload)
+    variant = f"max_edge={max_edge}"
+    cached = image_payload_cache.get(source_hash, variant)
+    if cached is not None:
+        return cached
+
+    downscaled_payload = await run_in_executor(downscale_image_payload, image_payload, max_edge)
+    image_payload_cache.put(source_hash, variant, downscaled_payload)
+    return downscaled_payload
+
+
+def downscale_image_payload(image_payload: tuple, max_edge: int) -> tuple:
+    """Shrink a base64 image payload to fit max_edge, returning it unchanged if already small or undecodable"""
+    try:
+        with Image.open(io.BytesIO(b"".join(b64decode_chunks(image_payload)))) as img:
+            if max(img.size) <= max_edge:
+                return image_payload
+            img.draft("RGB", (max_edge, max_edge))
+            preview = img.convert("RGB")
+            preview.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            output = io.BytesIO()
+            preview.save(output, format="JPEG", quality=85)
+    except Exception as e:
+        print(f"Preview downscale error: {e}")
+        return image_payload
+
+    return b64encode_chunks(output.getvalue())
+
+
+def resolve_local_image(image_url: str) -> Optional[dict]:
+    """Find an uploaded image in memory from its API or Supabase public URL"""
+    image_id = None
 
     if image_url.startswith("/api/image/"):
         image_id = image_url.split("/")[-1]
-        if image_id in uploaded_images:
-            return base64.b64encode(uploaded_images[image_id]["content"]).decode()
+    elif SUPABASE_URL and image_url.startswith(f"{SUPABASE_PUBLIC_PREFIX}patagon3d/"):
+        file_name = image_url[len(f"{SUPABASE_PUBLIC_PREFIX}patagon3d/"):]
+        if "/" not in file_name and file_name.endswith(".jpg"):
+            image_id = file_name[:-len(".jpg")]
+
+    if image_id:
+        return uploaded_images.get(image_id)
+    return None
+
+
+class PerceptualHashIndex:
+    """Multi-index hashing over 64-bit perceptual hashes for Hamming-radius queries
+
+    Each hash is split into 16-bit chunks with one lookup table per chunk. Two hashes
+    within distance r agree to within r // 4 bits on at least one chunk, so a query
+    only probes nearby chunk values and verifies the resulting candidates.
+    """
+
+    CHUNK_COUNT = 4
+    CHUNK_BITS = 16
+
+    def __init__(self):
+        self.records = {}
+        self.tables = [{} for _ in range(self.CHUNK_COUNT)]
+
+    def __len__(self):
+        return sum(len(records) for records in self.records.values())
+
+    def _chunks(self, phash: int) -> List[int]:
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(phash >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNK_COUNT)]
+
+    def add(self, phash: int, record: dict):
+        if phash in self.records:
+            self.records[phash].append(record)
+            return
+
+        self.records[phash] = [record]
+        for table, chunk in zip(self.tables, self._chunks(phash)):
+            table.setdefault(chunk, []).append(phash)
+
+    def query(self, phash: int, max_distance: int) -> List[tuple]:
+        """Return (distance, record) pairs within max_distance, closest first"""
+        flip_masks = chunk_flip_masks(self.CHUNK_BITS, max_distance // self.CHUNK_COUNT)
+
+        candidates = set()
+        for table, chunk in zip(self.tables, self._chunks(phash)):
+            for flip_mask in flip_masks:
+                candidates.update(table.get(chunk ^ flip_mask, ()))
+
+        matches = []
+        for candidate in candidates:
+            distance = hamming_distance(phash, candidate)
+            if distance <= max_distance:
+                matches.extend((distance, record) for record in self.records[candidate])
+
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+@lru_cache(maxsize=None)
+def chunk_flip_masks(bits: int, radius: int) -> tuple:
+    """All bit masks of the given width with at most radius bits set"""
+    return tuple(
+        sum(1 << bit for bit in flipped)
+        for count in range(radius + 1)
+        for flipped in combinations(range(bits), count)
+    )
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def compute_dhash_payload(image_payload: tuple) -> Optional[int]:
+    return compute_dhash(b"".join(b64decode_chunks(image_payload)))
+
+
+def compute_dhash(content: bytes, hash_size: int = 8) -> Optional[int]:
+    """Compute a 64-bit difference hash of an image, or None if it can't be decoded"""
+    if not PIL_AVAILABLE:
+        return None
+
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            # Let the JPEG decoder downscale while decoding
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+            pixels = list(small.getdata())
+    except Exception as e:
+        print(f"Perceptual hash error: {e}")
+        return None
+
+    phash = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            phash = (phash << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return phash
+
+
+async def get_image_phash(image_url: str) -> Optional[int]:
+    """Get the perceptual hash of an image, reusing the one computed at upload"""
+    if not PIL_AVAILABLE:
+        return None
+
+    image = resolve_local_image(image_url)
+    if image and image.get("phash") is not None:
+        return image["phash"]
+
+    image_payload = await get_image_payload(image_url, PROVIDER_VERTEX)
+    return await run_in_executor(compute_dhash_payload, image_payload)
+
+
+def index_measurement(user_email: str, phash: int, record: dict):
+    """Add a completed measurement to the user's similarity index"""
+    if user_email not in phash_indexes:
+        phash_indexes[user_email] = PerceptualHashIndex()
+    phash_indexes[user_email].add(phash, record)
+
+
+def find_similar_measurement(user_email: str, phash: int, room_type: str) -> Optional[dict]:
+    """Find the closest earlier measurement of a near-duplicate photo by the same user"""
+    index = phash_indexes.get(user_email)
+    if index is None:
+        return None
+
+    for distance, record in index.query(phash, PHASH_MATCH_MAX_DISTANCE):
+        if record["room_type"] == room_type:
+            return {**record, "distance": distance}
+    return None
+
+
+async def get_image_payload(image_url: str, provider: str = PROVIDER_VERTEX) -> tuple:
+    """Get the ready-to-send image payload (base64 chunks) for a provider, encoding each image once"""
 
     if image_url.startswith("data:"):
-        return image_url.split(",")[1]
+        image_chunks = await run_in_executor(str_to_chunks, image_url, image_url.index(",") + 1)
+        return format_image_payload(image_chunks, provider)
+
+    content = None
+    image = resolve_local_image(image_url)
+    if image:
+        content = image["content"]
+        content_hash = image["sha256"]
+    elif image_url.startswith("/api/image/"):
+        raise Exception("Image not found, please upload it again")
+    else:
+        content_hash = image_payload_cache.hash_for_url(image_url)
+
+    if content_hash:
+        image_chunks = image_payload_cache.get(content_hash, IMAGE_VARIANT_ORIGINAL)
+        if image_chunks is not None:
+            return format_image_payload(image_chunks, provider)
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(image_url)
-        if response.status_code == 200:
-            return base64.b64encode(response.content).decode()
-        raise Exception(f"Failed to fetch image: {response.status_code}")
+    if content is None:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(image_url)
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch image: {response.status_code}")
+        content = response.content
+        content_hash = await run_in_executor(sha256_hex, content)
+        image_payload_cache.remember_url(image_url, content_hash)
+
+    image_chunks = await run_in_executor(b64encode_chunks, content)
+    image_payload_cache.put(content_hash, IMAGE_VARIANT_ORIGINAL, image_chunks)
+    return format_image_payload(image_chunks, provider)
 
 
 # ============================================================================
@@ -801,10 +1924,19 @@ async def health_check():
         "status": "healthy",
         "service": "Patagon3d",
         "google_auth_library": GOOGLE_AUTH_AVAILABLE,
+        "pillow_library": PIL_AVAILABLE,
+        "brotli_library": BROTLI_AVAILABLE,
         "google_service_account_configured": bool(GOOGLE_SERVICE_ACCOUNT_JSON),
         "google_project_configured": bool(GOOGLE_CLOUD_PROJECT_ID),
         "openai_configured": bool(OPENAI_API_KEY),
-        "supabase_configured": bool(SUPABASE_URL)
+        "supabase_configured": bool(SUPABASE_URL),
+        "image_payload_cache": image_payload_cache.stats(),
+        "cpu_executor_workers": CPU_EXECUTOR_WORKERS,
+        "event_loop_lag": event_loop_lag,
+        "model_routing": {
+            "measurement": measurement_router.stats(),
+            "renovation": renovation_router.stats()
+        }
     }
 
 
@@ -0,0 +1,79 @@
+"""
+Patagon3d - Event loop lag benchmark for image payload handling
+
+Runs the app's event loop lag monitor while the executor encodes an upload, builds an
+Imagen request body and parses an Imagen response, comparing whole-buffer calls with
+the sliced helpers the backend uses.
+Usage: python benchmarks/event_loop_lag.py [--megabytes 20] [--interval 0.005]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def whole_encode(content: bytes) -> str:
+    return base64.b64encode(content).decode()
+
+
+def whole_body(image_base64: str) -> bytes:
+    return json.dumps({"instances": [{"referenceImage": {"bytesBase64Encoded": image_base64}}]}).encode()
+
+
+def whole_parse(content: bytes) -> str:
+    return json.loads(content)["predictions"][0]["bytesBase64Encoded"]
+
+
+async def measure(main, name: str, func, *args) -> float:
+    """Run func on the executor and return the worst lag the monitor saw meanwhile"""
+    await asyncio.sleep(main.EVENT_LOOP_LAG_INTERVAL * 4)
+    main.event_loop_lag["max_ms"] = 0.0
+    start = time.perf_counter()
+    result = await main.run_in_executor(func, *args)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    await asyncio.sleep(main.EVENT_LOOP_LAG_INTERVAL * 4)
+    print(f"{name:32s} work {elapsed_ms:7.0f} ms   max lag {main.event_loop_lag['max_ms']:7.1f} ms")
+    return result
+
+
+async def run(args):
+    import backend.main as main
+
+    monitor = asyncio.create_task(main.monitor_event_loop_lag())
+    content = os.urandom(args.megabytes * 1024 * 1024)
+    image_base64 = base64.b64encode(content).decode()
+    response = json.dumps({"predictions": [{"mimeType": "image/png", "bytesBase64Encoded": image_base64}]}).encode()
+    envelope = {"instances": [{"referenceImage": {"bytesBase64Encoded": main.IMAGE_PLACEHOLDER}}]}
+
+    print(f"payload: {args.megabytes} MB raw, monitor interval {main.EVENT_LOOP_LAG_INTERVAL * 1000:.0f} ms")
+    await measure(main, "encode (whole)", whole_encode, content)
+    chunks = await measure(main, "encode (sliced)", main.b64encode_chunks, content)
+    await measure(main, "request body (whole)", whole_body, image_base64)
+    await measure(main, "request body (spliced)", main.json_body_with_image, envelope, chunks)
+    await measure(main, "parse response (json.loads)", whole_parse, response)
+    await measure(main, "parse response (sliced)", main.parse_imagen_prediction, response)
+
+    monitor.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark event loop lag during image payload work")
+    parser.add_argument("--megabytes", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    # The monitor reads its interval at import time
+    os.environ["EVENT_LOOP_LAG_INTERVAL"] = str(args.interval)
+    os.environ.setdefault("EVENT_LOOP_LAG_THRESHOLD_MS", "1000000")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Patagon3d - Perceptual hash index lookup benchmark
+
+Builds a multi-index hash table of random 64-bit hashes and times Hamming-radius queries.
+Usage: python benchmarks/phash_index.py [--images 100000] [--queries 1000] [--radius 6]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from backend.main import PerceptualHashIndex, hamming_distance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark perceptual hash index lookups")
+    parser.add_argument("--images", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--radius", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [rng.getrandbits(64) for _ in range(args.images)]
+
+    index = PerceptualHashIndex()
+    start = time.perf_counter()
+    for i, phash in enumerate(hashes):
+        index.add(phash, {"job_id": str(i)})
+    build_time = time.perf_counter() - start
+
+    # Half the queries are near-duplicates of indexed photos, half are unrelated
+    queries = []
+    for i in range(args.queries):
+        if i % 2 == 0:
+            phash = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, args.radius)):
+                phash ^= 1 << bit
+        else:
+            phash = rng.getrandbits(64)
+        queries.append(phash)
+
+    start = time.perf_counter()
+    found = sum(1 for phash in queries if index.query(phash, args.radius))
+    index_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for phash in queries[:50]:
+        [h for h in hashes if hamming_distance(phash, h) <= args.radius]
+    scan_time = (time.perf_counter() - start) / min(50, len(queries))
+
+    print(f"images:            {args.images}")
+    print(f"build time:        {build_time:.2f} s")
+    print(f"queries:           {args.queries} (radius {args.radius}, {found} with matches)")
+    print(f"index lookup:      {index_time / len(queries) * 1000:.3f} ms/query")
+    print(f"linear scan:       {scan_time * 1000:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
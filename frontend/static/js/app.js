@@ -21,6 +21,8 @@ const translations = {
         processing: "Processing...",
         step2_title: "AI Measurements",
         analyzing_room: "AI is analyzing your room...",
+        similar_photo_found: "You measured a very similar photo earlier.",
+        btn_use_previous: "Use previous measurements",
         estimated_measurements: "Estimated Measurements",
         room_dimensions: "Room Dimensions",
         surface_areas: "Surface Areas",
@@ -63,6 +65,7 @@ const translations = {
         btn_generate: "Generate AI Renovation",
         ai_proposal: "AI Renovation Proposal",
         transforming_room: "AI is transforming your room...",
+        refining_preview: "Preview ready. Rendering full resolution...",
         btn_save: "Save",
         btn_download: "Download",
         btn_try_another: "Try Another",
@@ -92,6 +95,8 @@ const translations = {
         processing: "Procesando...",
         step2_title: "Medidas con IA",
         analyzing_room: "La IA esta analizando tu cuarto...",
+        similar_photo_found: "Ya mediste una foto muy similar antes.",
+        btn_use_previous: "Usar medidas anteriores",
         estimated_measurements: "Medidas Estimadas",
         room_dimensions: "Dimensiones del Cuarto",
         surface_areas: "Areas de Superficie",
@@ -134,6 +139,7 @@ const translations = {
         btn_generate: "Generar Renovacion con IA",
         ai_proposal: "Propuesta de Renovacion",
         transforming_room: "La IA esta transformando tu cuarto...",
+        refining_preview: "Vista previa lista. Generando resolucion completa...",
         btn_save: "Guardar",
         btn_download: "Descargar",
         btn_try_another: "Probar Otro",
@@ -160,12 +166,16 @@ let currentLang = localStorage.getItem('patagon3d_lang') || 'en';
 // State
 let currentImageUrl = null;
 let currentImageId = null;
+// Local data URL of the photo, only for <img> previews and the PDF
+let currentPreviewUrl = null;
 let selectedElement = 'cabinets';
 let selectedStyle = 'modern';
 let selectedColor = 'white';
 let selectedMaterial = null;
 let currentUser = null;
 let visualizationHistory = [];
+let activeMeasurementJobId = null;
+let activeRenovationJobId = null;
 
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
@@ -181,6 +191,11 @@ document.addEventListener('DOMContentLoaded', () => {
     initializePdfModal();
 });
 
+// Stop server-side work nobody is waiting for anymore
+window.addEventListener('pagehide', () => {
+    cancelActiveJobs();
+});
+
 // ============================================================================
 // LANGUAGE SYSTEM
 // ============================================================================
@@ -334,19 +349,13 @@ async function handleImageUpload(file) {
     progressText.textContent = t('uploading');
 
     try {
-        const formData = new FormData();
-        formData.append('file', file);
-
-        const response = await fetch('/api/upload-image', {
-            method: 'POST',
-            body: formData
+        const result = await uploadInChunks(file, (fraction) => {
+            progressFill.style.width = `${Math.round(10 + fraction * 60)}%`;
         });
 
         progressFill.style.width = '70%';
         progressText.textContent = t('processing');
 
-        const result = await response.json();
-
         if (result.success) {
             currentImageUrl = result.url;
             currentImageId = result.image_id;
@@ -358,7 +367,7 @@ async function handleImageUpload(file) {
 
             const reader = new FileReader();
             reader.onload = (e) => {
-                currentImageUrl = e.target.result;
+                currentPreviewUrl = e.target.result;
             };
             reader.readAsDataURL(file);
 
@@ -381,6 +390,80 @@ async function handleImageUpload(file) {
     }
 }
 
+async function uploadInChunks(file, onProgress) {
+    const initResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            filename: file.name,
+            size: file.size,
+            content_type: file.type || 'image/jpeg'
+        })
+    });
+    const upload = await initResponse.json();
+    if (!initResponse.ok) {
+        throw new Error(upload.detail || 'Upload failed');
+    }
+
+    let offset = upload.offset;
+    let retries = 0;
+    const maxRetries = 5;
+
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        let response = null;
+        let result = null;
+        try {
+            response = await fetch(`/api/uploads/${upload.upload_id}?offset=${offset}`, {
+                method: 'PUT',
+                body: chunk
+            });
+            result = await response.json();
+        } catch (error) {
+            // Dropped connection, or a proxy error page that isn't JSON
+            console.error('Upload chunk error:', error);
+        }
+
+        // Network errors, 5xx and offset conflicts: ask the server how far it got and resume
+        if (!result || response.status >= 500 || response.status === 409) {
+            if (++retries > maxRetries) {
+                throw new Error(result?.detail || 'Upload failed');
+            }
+            if (response?.status !== 409) {
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            }
+            offset = await getUploadOffset(upload.upload_id, offset);
+            continue;
+        }
+        if (!response.ok) {
+            throw new Error(result.detail || 'Upload failed');
+        }
+
+        offset = result.offset;
+        retries = 0;
+        onProgress(offset / file.size);
+    }
+
+    const finalizeResponse = await fetch(`/api/uploads/${upload.upload_id}/finalize`, { method: 'POST' });
+    const result = await finalizeResponse.json().catch(() => ({}));
+    if (!finalizeResponse.ok) {
+        throw new Error(result.detail || 'Upload failed');
+    }
+    return result;
+}
+
+async function getUploadOffset(uploadId, fallback) {
+    try {
+        const response = await fetch(`/api/uploads/${uploadId}`);
+        if (response.ok) {
+            return (await response.json()).offset;
+        }
+    } catch (err) {
+        console.error('Upload status error:', err);
+    }
+    return fallback;
+}
+
 // ============================================================================
 // AI MEASUREMENT ANALYSIS
 // ============================================================================
@@ -392,7 +475,8 @@ async function analyzeMeasurements() {
     const loadingIndicator = document.getElementById('measurements-loading');
     const resultsContainer = document.getElementById('measurements-results');
 
-    measurementPhoto.src = currentImageUrl;
+    measurementPhoto.src = currentPreviewUrl;
+    hideSimilarOffer();
     loadingIndicator.classList.remove('hidden');
     resultsContainer.classList.add('hidden');
 
@@ -407,6 +491,8 @@ async function analyzeMeasurements() {
         });
 
         const result = await response.json();
+        cancelJob('measurements', activeMeasurementJobId);
+        activeMeasurementJobId = result.job_id;
         await pollMeasurementStatus(result.job_id);
     } catch (error) {
         console.error('Measurement error:', error);
@@ -422,11 +508,20 @@ async function pollMeasurementStatus(jobId) {
     let attempts = 0;
 
     while (attempts < maxAttempts) {
+        // Superseded by a newer analysis
+        if (jobId !== activeMeasurementJobId) return;
+
         try {
             const response = await fetch(`/api/measurements/${jobId}`);
             const result = await response.json();
 
+            if (result.status === 'processing' && result.similar_match && !result.similar_match.applied) {
+                showSimilarOffer(jobId, result.similar_match);
+            }
+
             if (result.status === 'completed') {
+                activeMeasurementJobId = null;
+                hideSimilarOffer();
                 loadingIndicator.classList.add('hidden');
                 resultsContainer.classList.remove('hidden');
                 displayMeasurements(result.measurements);
@@ -438,14 +533,54 @@ async function pollMeasurementStatus(jobId) {
             await new Promise(resolve => setTimeout(resolve, 2000));
             attempts++;
         } catch (error) {
+            // Abandoning the poll loop; stop the server job too (no-op if it already failed)
+            cancelJob('measurements', jobId);
+            hideSimilarOffer();
             loadingIndicator.innerHTML = '<p class="error">Analysis failed: ' + error.message + '</p>';
             return;
         }
     }
 
+    cancelJob('measurements', jobId);
     loadingIndicator.innerHTML = '<p class="error">Analysis timed out. Please try again.</p>';
 }
 
+function showSimilarOffer(jobId, match) {
+    const offer = document.getElementById('similar-offer');
+    const applyBtn = document.getElementById('apply-similar-btn');
+    if (!offer || !offer.classList.contains('hidden')) return;
+
+    offer.classList.remove('hidden');
+    applyBtn.onclick = () => applySimilarMeasurements(jobId, match.job_id);
+}
+
+function hideSimilarOffer() {
+    document.getElementById('similar-offer')?.classList.add('hidden');
+}
+
+async function applySimilarMeasurements(jobId, previousJobId) {
+    const loadingIndicator = document.getElementById('measurements-loading');
+    const resultsContainer = document.getElementById('measurements-results');
+
+    try {
+        const response = await fetch(`/api/measurements/${previousJobId}`);
+        const previous = await response.json();
+        if (!response.ok || !previous.measurements) {
+            throw new Error(previous.detail || 'Previous measurements unavailable');
+        }
+
+        // Skip the new analysis entirely
+        cancelJob('measurements', jobId);
+        hideSimilarOffer();
+        loadingIndicator.classList.add('hidden');
+        resultsContainer.classList.remove('hidden');
+        displayMeasurements(previous.measurements);
+    } catch (error) {
+        console.error('Apply previous measurements error:', error);
+        hideSimilarOffer();
+    }
+}
+
 function displayMeasurements(measurements) {
     const roomDimensions = document.getElementById('room-dimensions');
     const surfaceAreas = document.getElementById('surface-areas');
@@ -607,6 +742,11 @@ async function generateRenovation() {
     renovationLoading.classList.remove('hidden');
     renovationImageContainer.classList.add('hidden');
 
+    const loadingText = renovationLoading.querySelector('p');
+    if (loadingText) {
+        loadingText.textContent = t('transforming_room');
+    }
+
     try {
         const response = await fetch('/api/renovate', {
             method: 'POST',
@@ -621,6 +761,8 @@ async function generateRenovation() {
         });
 
         const result = await response.json();
+        cancelJob('renovation', activeRenovationJobId);
+        activeRenovationJobId = result.job_id;
         await pollRenovationStatus(result.job_id);
     } catch (error) {
         console.error('Renovation error:', error);
@@ -635,18 +777,33 @@ async function pollRenovationStatus(jobId) {
 
     const maxAttempts = 60;
     let attempts = 0;
+    let previewShown = false;
 
     while (attempts < maxAttempts) {
+        // Superseded by a newer renovation
+        if (jobId !== activeRenovationJobId) return;
+
         try {
             const response = await fetch(`/api/renovation/${jobId}`);
             const result = await response.json();
 
+            if (result.status === 'processing' && result.preview_url && !previewShown) {
+                previewShown = true;
+                renovationImageContainer.classList.remove('hidden');
+                renovationImage.src = result.preview_url;
+                const loadingText = renovationLoading.querySelector('p');
+                if (loadingText) {
+                    loadingText.textContent = t('refining_preview');
+                }
+            }
+
             if (result.status === 'completed') {
+                activeRenovationJobId = null;
                 renovationLoading.classList.add('hidden');
                 renovationImageContainer.classList.remove('hidden');
                 renovationImage.src = result.generated_url;
 
-                document.getElementById('compare-before').src = currentImageUrl;
+                document.getElementById('compare-before').src = currentPreviewUrl;
                 document.getElementById('compare-after').src = result.generated_url;
 
                 return;
@@ -657,14 +814,31 @@ async function pollRenovationStatus(jobId) {
             await new Promise(resolve => setTimeout(resolve, 2000));
             attempts++;
         } catch (error) {
+            // Abandoning the poll loop; stop the server job too (no-op if it already failed)
+            cancelJob('renovation', jobId);
             renovationLoading.innerHTML = '<p class="error">Renovation failed: ' + error.message + '</p>';
             return;
         }
     }
 
+    cancelJob('renovation', jobId);
     renovationLoading.innerHTML = '<p class="error">Renovation timed out. Please try again.</p>';
 }
 
+function cancelJob(kind, jobId) {
+    if (!jobId) return;
+    if (kind === 'measurements' && jobId === activeMeasurementJobId) activeMeasurementJobId = null;
+    if (kind === 'renovation' && jobId === activeRenovationJobId) activeRenovationJobId = null;
+
+    // keepalive lets the request finish while the page is unloading
+    fetch(`/api/${kind}/${jobId}`, { method: 'DELETE', keepalive: true }).catch(() => {});
+}
+
+function cancelActiveJobs() {
+    cancelJob('measurements', activeMeasurementJobId);
+    cancelJob('renovation', activeRenovationJobId);
+}
+
 // ============================================================================
 // HISTORY & PDF
 // ============================================================================
@@ -675,7 +849,7 @@ function saveToHistory() {
 
     const item = {
         id: Date.now(),
-        originalUrl: currentImageUrl,
+        originalUrl: currentPreviewUrl,
         generatedUrl: renovationImage.src,
         element: selectedElement,
         style: selectedStyle,
@@ -926,12 +1100,12 @@ function initializeActions() {
     document.getElementById('analyze-btn')?.addEventListener('click', analyzeMeasurements);
 
     document.getElementById('continue-btn')?.addEventListener('click', () => {
-        document.getElementById('original-photo').src = currentImageUrl;
+        document.getElementById('original-photo').src = currentPreviewUrl;
         showSection('renovation');
     });
 
     document.getElementById('to-renovation-btn')?.addEventListener('click', () => {
-        document.getElementById('original-photo').src = currentImageUrl;
+        document.getElementById('original-photo').src = currentPreviewUrl;
         showSection('renovation');
     });
 
@@ -974,8 +1148,10 @@ function showSection(sectionName) {
 }
 
 function resetApp() {
+    cancelActiveJobs();
     currentImageUrl = null;
     currentImageId = null;
+    currentPreviewUrl = null;
     visualizationHistory = [];
 
     document.getElementById('upload-area').classList.remove('hidden');